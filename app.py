@@ -1,16 +1,32 @@
 import streamlit as st
 from rag.config import HF_TOKEN, HF_LLM_REPO_ID, CHROMA_DIR
-from rag.utils import ensure_dirs
+from rag.utils import ensure_dirs, save_uploaded_file
 from rag.db import init_db, create_session, log_document, log_message, log_query, get_recent_messages
-from rag.ingestion import load_documents, chunk_documents
-from rag.retrieval import build_vectorstore, load_vectorstore, get_hf_llm, build_qa_chain
-import os
-from pathlib import Path
+from rag.pipeline import ingest_files
+from rag.retrieval import load_vectorstore, get_embeddings, get_hf_llm, build_qa_chain
+from rag.index_store import index_exists, resolve_index_dir
 import uuid
 
-# Initialize
-ensure_dirs()
-init_db()
+# Long-lived resources survive Streamlit reruns instead of being rebuilt every interaction
+@st.cache_resource
+def cached_embeddings():
+    return get_embeddings()
+
+@st.cache_resource
+def cached_llm(hf_token: str, repo_id: str):
+    return get_hf_llm(hf_token=hf_token, repo_id=repo_id)
+
+@st.cache_resource(max_entries=16)
+def cached_vectorstore(index_dir: str):
+    # Keyed by index version directory, so a rebuild publishes a new key and the store is reopened
+    return load_vectorstore(index_dir, embeddings=cached_embeddings())
+
+@st.cache_resource(show_spinner=False)
+def initialize_storage():
+    ensure_dirs()
+    init_db()
+
+initialize_storage()
 
 # Session state initialization
 if 'session_id' not in st.session_state:
@@ -23,6 +39,9 @@ if 'messages' not in st.session_state:
 if 'vectorstore_exists' not in st.session_state:
     st.session_state.vectorstore_exists = False
 
+if 'processed_files' not in st.session_state:
+    st.session_state.processed_files = set()
+
 # Streamlit UI
 st.set_page_config(page_title="🤖 Universal AI Assistant", page_icon="🤖", layout="wide")
 
@@ -52,34 +71,31 @@ with st.sidebar:
                 if not HF_TOKEN:
                     st.error("Hugging Face token not found. Please set HUGGINGFACEHUB_API_TOKEN in your .env file.")
                 else:
-                    # Save and process files
-                    all_docs = []
-                    for uploaded_file in uploaded_files:
-                        # Create temp file
-                        import tempfile
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-                            tmp_file.write(uploaded_file.read())
-                            tmp_path = tmp_file.name
-                        
-                        # Load documents
-                        docs = load_documents(tmp_path)
-                        all_docs.extend(docs)
-                        
-                        # Log document
-                        log_document(st.session_state.session_id, uploaded_file.name, tmp_path)
-                    
-                    if all_docs:
-                        # Chunk documents
-                        chunks = chunk_documents(all_docs, chunk_size=800, chunk_overlap=150)
+                    # Only files not processed earlier in this session are parsed and embedded
+                    new_files = [
+                        f for f in uploaded_files
+                        if (f.name, f.size) not in st.session_state.processed_files
+                    ]
+                    if not new_files:
+                        st.info("All uploaded files are already in the knowledge base.")
+                    else:
+                        paths = []
+                        for uploaded_file in new_files:
+                            path = save_uploaded_file(uploaded_file, st.session_state.session_id)
+                            log_document(st.session_state.session_id, uploaded_file.name, path)
+                            paths.append(path)
                         
-                        # Build vectorstore
+                        # Parse, chunk, embed and persist as an overlapping pipeline
                         persist_dir = f"{CHROMA_DIR}/{st.session_state.session_id}"
-                        build_vectorstore(chunks, persist_dir=persist_dir)
+                        stats = ingest_files(paths, persist_dir, embeddings=cached_embeddings(),
+                                             chunk_size=800, chunk_overlap=150)
                         
-                        st.session_state.vectorstore_exists = True
-                        st.success(f"✅ Processed {len(uploaded_files)} file(s) and created {len(chunks)} knowledge chunks!")
-                    else:
-                        st.error("No documents processed successfully.")
+                        if stats["chunks"]:
+                            st.session_state.processed_files.update((f.name, f.size) for f in new_files)
+                            st.session_state.vectorstore_exists = True
+                            st.success(f"✅ Processed {len(new_files)} new file(s) and created {stats['chunks']} knowledge chunks!")
+                        else:
+                            st.error("No documents processed successfully.")
                         
             except Exception as e:
                 st.error(f"Error processing documents: {str(e)}")
@@ -88,7 +104,7 @@ with st.sidebar:
     st.divider()
     st.subheader("📊 Status")
     persist_dir = f"{CHROMA_DIR}/{st.session_state.session_id}"
-    vectorstore_exists = Path(persist_dir).exists() and any(Path(persist_dir).iterdir())
+    vectorstore_exists = index_exists(persist_dir)
     st.session_state.vectorstore_exists = vectorstore_exists
     
     if vectorstore_exists:
@@ -124,17 +140,17 @@ if prompt := st.chat_input("Ask me anything - I'm here to help with any question
             else:
                 persist_dir = f"{CHROMA_DIR}/{st.session_state.session_id}"
                 
-                if Path(persist_dir).exists() and st.session_state.vectorstore_exists:
+                if index_exists(persist_dir) and st.session_state.vectorstore_exists:
                     # Load vectorstore and get response based on documents
-                    vectordb = load_vectorstore(persist_dir)
-                    llm = get_hf_llm(hf_token=HF_TOKEN, repo_id=HF_LLM_REPO_ID)
+                    vectordb = cached_vectorstore(resolve_index_dir(persist_dir))
+                    llm = cached_llm(HF_TOKEN, HF_LLM_REPO_ID)
                     qa = build_qa_chain(vectordb, llm)
                     
                     result = qa({"query": prompt})
                     response = result["result"]
                 else:
                     # Use general LLM without document context
-                    llm = get_hf_llm(hf_token=HF_TOKEN, repo_id=HF_LLM_REPO_ID)
+                    llm = cached_llm(HF_TOKEN, HF_LLM_REPO_ID)
                     response = llm.invoke(prompt)
                 
                 # Log messages
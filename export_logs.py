@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Export conversation and query history from data/app.db as NDJSON or CSV,
+or print aggregate query statistics.
+
+    python export_logs.py messages --format csv --since 2024-01-01 -o messages.csv
+    python export_logs.py queries --session-id <id>
+    python export_logs.py stats
+"""
+import argparse
+import json
+import sys
+
+from rag.db import EXPORT_COLUMNS, get_query_stats
+from rag.export import stream_history, EXPORT_FORMATS
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export chat history from the app database")
+    parser.add_argument("table", choices=list(EXPORT_COLUMNS) + ["stats"])
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--session-id", help="Only export rows for this session")
+    parser.add_argument("--since", help="Inclusive lower bound on created_at (ISO 8601)")
+    parser.add_argument("--until", help="Exclusive upper bound on created_at (ISO 8601)")
+    parser.add_argument("--after-id", type=int, default=0, help="Resume after this row id")
+    parser.add_argument("--page-size", type=positive_int, default=500)
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    args = parser.parse_args()
+
+    filters = {"session_id": args.session_id, "since": args.since, "until": args.until}
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        if args.table == "stats":
+            json.dump(get_query_stats(**filters), out, indent=2)
+            out.write("\n")
+        else:
+            for chunk in stream_history(args.table, args.format, after_id=args.after_id,
+                                        page_size=args.page_size, **filters):
+                out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
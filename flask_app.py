@@ -1,13 +1,17 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context
 from flask_cors import CORS
+import hmac
 import uuid
-from pathlib import Path
-from rag.config import HF_TOKEN, HF_LLM_REPO_ID, CHROMA_DIR
+from rag import config
+from rag.config import HF_TOKEN, HF_LLM_REPO_ID, CHROMA_DIR, EXPORT_API_TOKEN
+from rag.admission import ConcurrencyLimiter, RateLimiter, RateLimited, Rejected
 from rag.utils import save_uploaded_file, ensure_dirs
-from rag.db import init_db, create_session, log_document, log_message, log_query, get_recent_messages
-from rag.ingestion import load_documents, chunk_documents
-from rag.retrieval import build_vectorstore, load_vectorstore, get_hf_llm, build_qa_chain
-from pathlib import Path
+from rag.db import init_db, create_session, log_document, log_message, log_query, get_recent_messages, get_query_stats, EXPORT_COLUMNS
+from rag.export import stream_history, EXPORT_FORMATS
+from rag.pipeline import ingest_files
+from rag.retrieval import load_vectorstore, get_hf_llm, build_qa_chain
+from rag.scoping import build_search_filter, load_metadata_index
+from rag.index_store import ensure_metadata_index, index_exists, resolve_index_dir
 import os
 
 app = Flask(__name__)
@@ -16,6 +20,20 @@ app.secret_key = os.environ.get('SECRET_KEY', 'fallback_secret_key')
 ensure_dirs()
 init_db()
 
+llm_limiter = ConcurrencyLimiter("LLM", config.LLM_MAX_CONCURRENCY, config.LLM_MAX_QUEUE, config.LLM_QUEUE_TIMEOUT)
+ingest_limiter = ConcurrencyLimiter("Document ingestion", config.INGEST_MAX_CONCURRENCY,
+                                    config.INGEST_MAX_QUEUE, config.INGEST_QUEUE_TIMEOUT)
+chat_rate = RateLimiter(config.CHAT_RATE_PER_SEC, config.CHAT_RATE_BURST)
+ingest_rate = RateLimiter(config.INGEST_RATE_PER_SEC, config.INGEST_RATE_BURST)
+
+@app.errorhandler(Rejected)
+def handle_rejected(e):
+    status = 429 if isinstance(e, RateLimited) else 503
+    response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+    response.status_code = status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
 # Initialize session
 @app.before_request
 def initialize_session():
@@ -27,7 +45,7 @@ def initialize_session():
 def index():
     session_id = session['session_id']
     persist_dir = f"{CHROMA_DIR}/{session_id}"
-    vectorstore_exists = Path(persist_dir).exists() and any(Path(persist_dir).iterdir())
+    vectorstore_exists = index_exists(persist_dir)
     
     return render_template('index.html', 
                           vectorstore_exists=vectorstore_exists,
@@ -48,52 +66,44 @@ def process_documents():
         
         session_id = session['session_id']
         persist_dir = f"{CHROMA_DIR}/{session_id}"
+        ingest_rate.check(session_id)
         
-        all_docs = []
-        for file in files:
-            if file and file.filename != '':
-                # Validate file extension with more robust checking
-                filename_lower = file.filename.lower().strip()
-                if not (filename_lower.endswith('.pdf') or filename_lower.endswith('.docx')):
-                    return jsonify({'error': f'File {file.filename} is not supported. Only PDF and DOCX files are allowed.'}), 400
-                
-                print(f"Received file: {file.filename}")
-                print(f"File content type: {getattr(file, 'content_type', 'unknown')}")
+        with ingest_limiter.slot():
+            paths = []
+            for file in files:
+                if file and file.filename != '':
+                    # Validate file extension with more robust checking
+                    filename_lower = file.filename.lower().strip()
+                    if not (filename_lower.endswith('.pdf') or filename_lower.endswith('.docx')):
+                        return jsonify({'error': f'File {file.filename} is not supported. Only PDF and DOCX files are allowed.'}), 400
                 
-                path = save_uploaded_file(file, session_id)
-                log_document(session_id, file.filename, path)
+                    print(f"Received file: {file.filename}")
+                    print(f"File content type: {getattr(file, 'content_type', 'unknown')}")
                 
-                # Debug: print the path to see what was saved
-                print(f"Saved file path: {path}")
-                print(f"Type of path: {type(path)}")
-                print(f"String representation: {str(path)}")
-                print(f"Lowercase path: {str(path).lower()}")
-                print(f"File path ends with .pdf: {str(path).lower().endswith('.pdf')}")
-                print(f"File path ends with .docx: {str(path).lower().endswith('.docx')}")
-                
-                # Try to load documents and catch specific errors
-                try:
-                    docs = load_documents(path)
-                    all_docs.extend(docs)
-                except ValueError as ve:
-                    print(f"Error loading document {path}: {str(ve)}")
-                    print(f"File path exists: {Path(path).exists()}")
-                    if "Only PDF and DOCX are supported" in str(ve):
-                        return jsonify({'error': f'File {file.filename} could not be processed. The file extension might be incorrect or the file may be corrupted. Please verify it is a valid PDF or DOCX file.'}), 400
-                    else:
-                        raise ve
-        
-        if not all_docs:
-            return jsonify({'error': 'No valid documents processed'}), 400
-        
-        chunks = chunk_documents(all_docs, chunk_size=800, chunk_overlap=150)
-        build_vectorstore(chunks, persist_dir=persist_dir)
+                    path = save_uploaded_file(file, session_id)
+                    log_document(session_id, file.filename, path)
+                    print(f"Saved file path: {path}")
+                    paths.append(path)
+        
+            # Parsing, chunking, embedding and persisting overlap in a bounded pipeline
+            try:
+                stats = ingest_files(paths, persist_dir, chunk_size=800, chunk_overlap=150)
+            except ValueError as ve:
+                print(f"Error loading documents: {str(ve)}")
+                if "Only PDF and DOCX are supported" in str(ve):
+                    return jsonify({'error': 'A file could not be processed. The file extension might be incorrect or the file may be corrupted. Please verify it is a valid PDF or DOCX file.'}), 400
+                raise
+        
+            if not stats['chunks']:
+                return jsonify({'error': 'No valid documents processed'}), 400
         
         return jsonify({
             'success': True,
-            'message': f'Processed {len(files)} file(s) and created {len(chunks)} knowledge chunks.',
-            'chunk_count': len(chunks)
+            'message': f'Processed {stats["files"]} file(s) and created {stats["chunks"]} knowledge chunks.',
+            'chunk_count': stats['chunks']
         })
+    except Rejected:
+        raise
     except Exception as e:
         print(f"Error processing documents: {str(e)}")
         return jsonify({'error': f'Error processing documents: {str(e)}'}), 500
@@ -115,20 +125,37 @@ def chat():
         
         session_id = session['session_id']
         persist_dir = f"{CHROMA_DIR}/{session_id}"
+        chat_rate.check(session_id)
         
-        if not Path(persist_dir).exists():
+        if not index_exists(persist_dir):
             return jsonify({'error': 'Vector store not found. Please upload and process documents first.'}), 400
         
+        # Pin the live index version for this request; a concurrent upload publishes a new one
+        index_dir = resolve_index_dir(persist_dir)
         try:
-            vectordb = load_vectorstore(persist_dir)
+            vectordb = load_vectorstore(index_dir)
         except Exception as e:
             return jsonify({'error': f'Error loading vector store: {str(e)}'}), 500
         
+        # Optional scope, e.g. {"filename": "guideline.pdf", "page_from": 3, "page_to": 7}
+        scope = data.get('filter') or {}
+        if not isinstance(scope, dict):
+            return jsonify({'error': 'filter must be an object with filename, page_from and/or page_to'}), 400
+        try:
+            page_from = int(scope['page_from']) if scope.get('page_from') is not None else None
+            page_to = int(scope['page_to']) if scope.get('page_to') is not None else None
+            if scope.get('filename'):
+                ensure_metadata_index(persist_dir, index_dir)
+            search_filter = build_search_filter(index_dir, scope.get('filename'), page_from, page_to)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'Invalid filter: {str(e)}'}), 400
+        
         try:
             llm = get_hf_llm(hf_token=HF_TOKEN, repo_id=HF_LLM_REPO_ID)
-            qa = build_qa_chain(vectordb, llm)
+            qa = build_qa_chain(vectordb, llm, search_filter=search_filter)
             
-            result = qa({"query": user_message})
+            with llm_limiter.slot():
+                result = qa({"query": user_message})
             answer = result["result"]
             
             # Log messages
@@ -140,9 +167,13 @@ def chat():
                 'response': answer,
                 'message': user_message
             })
+        except Rejected:
+            raise
         except Exception as e:
             print(f"Error in chat processing: {str(e)}")
             return jsonify({'error': f'Error processing request: {str(e)}'}), 500
+    except Rejected:
+        raise
     except Exception as e:
         print(f"Unexpected error in chat: {str(e)}")
         return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
@@ -152,7 +183,7 @@ def status():
     try:
         session_id = session['session_id']
         persist_dir = f"{CHROMA_DIR}/{session_id}"
-        vectorstore_exists = Path(persist_dir).exists() and any(Path(persist_dir).iterdir())
+        vectorstore_exists = index_exists(persist_dir)
         
         return jsonify({
             'vectorstore_exists': vectorstore_exists,
@@ -166,5 +197,76 @@ def status():
             'error': str(e)
         }), 500
 
+@app.route('/documents')
+def documents():
+    session_id = session['session_id']
+    persist_dir = f"{CHROMA_DIR}/{session_id}"
+    index_dir = resolve_index_dir(persist_dir)
+    if index_exists(persist_dir):
+        ensure_metadata_index(persist_dir, index_dir)
+    files = load_metadata_index(index_dir)["files"].values()
+    return jsonify({'documents': [
+        {
+            'filename': entry['filename'],
+            'chunks': entry['chunks'],
+            'first_page': entry['first_page'] + 1 if entry['first_page'] is not None else None,
+            'last_page': entry['last_page'] + 1 if entry['last_page'] is not None else None,
+        }
+        for entry in files
+    ]})
+
+@app.route('/metrics')
+def metrics():
+    return jsonify({
+        'llm': llm_limiter.stats(),
+        'ingestion': ingest_limiter.stats(),
+        'chat_rate_limit': chat_rate.stats(),
+        'ingest_rate_limit': ingest_rate.stats(),
+    })
+
+def _export_authorized():
+    supplied = request.headers.get('X-Export-Token', '')
+    return bool(EXPORT_API_TOKEN) and hmac.compare_digest(supplied.encode(), EXPORT_API_TOKEN.encode())
+
+def _export_filters():
+    return {
+        'session_id': request.args.get('session_id') or None,
+        'since': request.args.get('since') or None,
+        'until': request.args.get('until') or None,
+    }
+
+@app.route('/export/<table>')
+def export_history(table):
+    if not _export_authorized():
+        return jsonify({'error': 'Export is disabled or the export token is invalid.'}), 403
+    if table not in EXPORT_COLUMNS:
+        return jsonify({'error': f'Unknown table {table}. Use one of: {", ".join(EXPORT_COLUMNS)}.'}), 404
+
+    fmt = request.args.get('format', 'ndjson').lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format {fmt}. Use one of: {", ".join(EXPORT_FORMATS)}.'}), 400
+    try:
+        after_id = int(request.args.get('after_id', 0))
+    except ValueError:
+        return jsonify({'error': 'after_id must be an integer'}), 400
+
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+    body = stream_history(table, fmt, after_id=after_id, **_export_filters())
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={table}.{fmt}'}
+    )
+
+@app.route('/export/stats')
+def export_stats():
+    if not _export_authorized():
+        return jsonify({'error': 'Export is disabled or the export token is invalid.'}), 403
+    try:
+        return jsonify(get_query_stats(**_export_filters()))
+    except Exception as e:
+        print(f"Error computing query stats: {str(e)}")
+        return jsonify({'error': f'Error computing query stats: {str(e)}'}), 500
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
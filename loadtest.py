@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Load-test flask_app.py with realistic upload-then-chat sessions.
+
+Start a server whose LLM (and optionally embeddings) are local stand-ins:
+
+    python loadtest.py serve --llm-latency 0.8 --llm-jitter 0.3 --fake-embeddings
+
+Then sweep concurrency levels against it (or against any running instance):
+
+    python loadtest.py run --url http://127.0.0.1:5001 --levels 1,2,4,8,16,32 --duration 30
+
+Each virtual user opens a fresh session, uploads a document, asks a few
+questions and starts over. For every level the report lists throughput,
+error rate and latency percentiles per endpoint, and marks the first level
+where p99 /chat latency or the error rate crosses the given limits.
+"""
+import argparse
+import http.client
+import http.cookiejar
+import io
+import json
+import math
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+QUESTIONS = [
+    "What are the patient's key medical conditions?",
+    "Summarise the discharge recommendations.",
+    "Which medications are mentioned in the guideline?",
+    "What follow-up is advised after the procedure?",
+    "What are the warning signs that require urgent review?",
+]
+
+PARAGRAPHS = [
+    "Patients with a history of hypertension should have blood pressure reviewed at every visit.",
+    "Syncope after discharge warrants an ECG and review of anti-arrhythmic therapy.",
+    "Follow-up with cardiology is advised within two weeks of an inpatient admission.",
+    "Warning signs include chest pain, breathlessness at rest and new palpitations.",
+    "Medication reconciliation must be completed before discharge and shared with the GP.",
+]
+
+
+# ---------------------------------------------------------------- stand-ins
+
+class _StandInReply:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class StandInLLM:
+    """Chat model stand-in that sleeps for a configurable latency, then echoes a fixed answer."""
+
+    def __init__(self, latency: float, jitter: float, answer_chars: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.answer_chars = answer_chars
+
+    def invoke(self, messages):
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        return _StandInReply(("- Stand-in answer based on the uploaded documents. " * 20)[:self.answer_chars])
+
+
+def serve(args):
+    # Settings must be in the environment before rag.config is imported
+    os.environ.setdefault("HUGGINGFACEHUB_API_TOKEN", "loadtest")
+    if not args.keep_rate_limits:
+        os.environ.setdefault("CHAT_RATE_PER_SEC", "0")
+        os.environ.setdefault("INGEST_RATE_PER_SEC", "0")
+
+    import rag.retrieval
+
+    llm = StandInLLM(args.llm_latency, args.llm_jitter, args.answer_chars)
+    rag.retrieval.get_hf_llm = lambda hf_token, repo_id: llm
+    if args.fake_embeddings:
+        from langchain_community.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=384)
+        rag.retrieval.get_embeddings = lambda *a, **kw: embeddings
+
+    import flask_app
+    print(f"Serving flask_app with stand-in LLM ({args.llm_latency}s ± {args.llm_jitter}s) "
+          f"on http://{args.host}:{args.port}")
+    flask_app.app.run(host=args.host, port=args.port, threaded=True, debug=False)
+
+
+# ---------------------------------------------------------------- client
+
+def make_docx(paragraphs) -> bytes:
+    """Minimal DOCX with one <w:p> per paragraph; enough for Docx2txtLoader."""
+    body = "".join(f"<w:p><w:r><w:t>{p}</w:t></w:r></w:p>" for p in paragraphs)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            '</Types>'))
+        z.writestr("_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="word/document.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+            '</Relationships>'))
+        z.writestr("word/document.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{body}</w:body></w:document>'))
+    return buffer.getvalue()
+
+
+def _multipart(filename: str, content: bytes):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+
+    def add(self, endpoint: str, status: int, seconds: float):
+        with self._lock:
+            self.samples.append((endpoint, status, seconds))
+
+
+def _request(opener, recorder, endpoint, url, data=None, headers=None, timeout=120):
+    request = urllib.request.Request(url, data=data, headers=headers or {})
+    started = time.perf_counter()
+    try:
+        with opener.open(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except (urllib.error.URLError, OSError, http.client.HTTPException):
+        # Refused, reset or truncated responses count as failed requests
+        status = 0
+    recorder.add(endpoint, status, time.perf_counter() - started)
+    return status
+
+
+def virtual_user(base_url, next_document, recorder, deadline, turns, think_time):
+    while time.monotonic() < deadline:
+        # A fresh cookie jar is a fresh server-side session
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        _request(opener, recorder, "/status", f"{base_url}/status")
+        body, content_type = _multipart(*next_document())
+        status = _request(opener, recorder, "/process_documents", f"{base_url}/process_documents",
+                          data=body, headers={"Content-Type": content_type})
+        if status != 200:
+            time.sleep(think_time)
+            continue
+        for _ in range(turns):
+            if time.monotonic() >= deadline:
+                return
+            payload = json.dumps({"message": random.choice(QUESTIONS)}).encode()
+            _request(opener, recorder, "/chat", f"{base_url}/chat",
+                     data=payload, headers={"Content-Type": "application/json"})
+            time.sleep(random.uniform(0, 2 * think_time))
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarise(samples, elapsed: float):
+    endpoints = {}
+    for endpoint, status, seconds in samples:
+        endpoints.setdefault(endpoint, []).append((status, seconds))
+    summary = {}
+    for endpoint, rows in sorted(endpoints.items()):
+        ok = [seconds for status, seconds in rows if status == 200]
+        summary[endpoint] = {
+            "requests": len(rows),
+            "throughput_rps": round(len(ok) / elapsed, 2),
+            "error_rate": round(1 - len(ok) / len(rows), 4),
+            "rejected_429": sum(1 for status, _ in rows if status == 429),
+            "rejected_503": sum(1 for status, _ in rows if status == 503),
+            "p50_ms": round(percentile(ok, 50) * 1000, 1),
+            "p90_ms": round(percentile(ok, 90) * 1000, 1),
+            "p99_ms": round(percentile(ok, 99) * 1000, 1),
+            "max_ms": round(max(ok) * 1000, 1) if ok else 0.0,
+        }
+    return summary
+
+
+def saturation_reason(endpoints, p99_limit_ms: float, error_limit: float):
+    """Why a level counts as saturated, or None. A level where no session gets to chat is never clean."""
+    upload = endpoints.get("/process_documents")
+    if upload and upload["error_rate"] > error_limit:
+        return f"/process_documents error rate {upload['error_rate']:.1%} > {error_limit:.0%}"
+    chat = endpoints.get("/chat")
+    if not chat or chat["error_rate"] >= 1:
+        return "no successful /chat requests"
+    if chat["error_rate"] > error_limit:
+        return f"/chat error rate {chat['error_rate']:.1%} > {error_limit:.0%}"
+    if chat["p99_ms"] > p99_limit_ms:
+        return f"p99 /chat {chat['p99_ms']} ms > {p99_limit_ms} ms"
+    return None
+
+
+def run(args):
+    base_url = args.url.rstrip("/")
+    if args.document:
+        with open(args.document, "rb") as f:
+            document = (os.path.basename(args.document), f.read())
+        next_document = lambda: document
+    else:
+        # A unique line per upload keeps the server's parsed-text cache from serving every session
+        next_document = lambda: ("loadtest-guideline.docx", make_docx(
+            PARAGRAPHS * args.doc_repeat + [f"Reference {uuid.uuid4().hex}"]))
+
+    levels = [int(level) for level in args.levels.split(",")]
+    report = {"url": base_url, "duration_s": args.duration, "turns": args.turns,
+              "think_time_s": args.think_time, "levels": []}
+    saturated_at = None
+    report["saturated_at_concurrency"] = None
+    for level in levels:
+        recorder = Recorder()
+        started = time.monotonic()
+        deadline = started + args.duration
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            users = [pool.submit(virtual_user, base_url, next_document, recorder, deadline, args.turns, args.think_time)
+                     for _ in range(level)]
+        for user in users:
+            user.result()  # a crashed virtual user must fail the run, not look like an idle level
+        elapsed = time.monotonic() - started
+        endpoints = summarise(recorder.samples, elapsed)
+        reason = saturation_reason(endpoints, args.p99_limit_ms, args.error_limit)
+        report["levels"].append({"concurrency": level, "elapsed_s": round(elapsed, 1), "endpoints": endpoints,
+                                 "saturation": reason})
+
+        chat = endpoints.get("/chat", {})
+        upload = endpoints.get("/process_documents", {})
+        print(f"concurrency={level:<4} chat: {chat.get('throughput_rps', 0)} rps, "
+              f"p99 {chat.get('p99_ms', 0)} ms, errors {chat.get('error_rate', 0):.1%}; "
+              f"upload errors {upload.get('error_rate', 0):.1%}" + (f" -> saturated: {reason}" if reason else ""))
+        if saturated_at is None and reason:
+            saturated_at = level
+            report["saturation_reason"] = reason
+        report["saturated_at_concurrency"] = saturated_at
+        # Rewritten after every level so finished levels survive an aborted sweep
+        write_report(report, args)
+    print(f"Saturation report written to {args.output}")
+
+
+def write_report(report, args):
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    with open(os.path.splitext(args.output)[0] + ".md", "w") as f:
+        f.write(render_markdown(report, args))
+
+
+def render_markdown(report, args):
+    lines = [
+        f"# Load test: {report['url']}",
+        "",
+        f"{report['duration_s']}s per level, {report['turns']} chat turns per session, "
+        f"~{report['think_time_s']}s think time.",
+        "",
+        "| Concurrency | Endpoint | Requests | OK rps | Errors | 429 | 503 | p50 ms | p90 ms | p99 ms |",
+        "|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for level in report["levels"]:
+        for endpoint, s in level["endpoints"].items():
+            lines.append(
+                f"| {level['concurrency']} | {endpoint} | {s['requests']} | {s['throughput_rps']} | "
+                f"{s['error_rate']:.1%} | {s['rejected_429']} | {s['rejected_503']} | "
+                f"{s['p50_ms']} | {s['p90_ms']} | {s['p99_ms']} |"
+            )
+    lines.append("")
+    if report["saturated_at_concurrency"] is None:
+        lines.append(f"No level exceeded p99 /chat > {args.p99_limit_ms} ms or an upload/chat error rate "
+                     f"> {args.error_limit:.0%}.")
+    else:
+        lines.append(f"Saturated at concurrency {report['saturated_at_concurrency']}: "
+                     f"{report['saturation_reason']}.")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Flask RAG server")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_serve = sub.add_parser("serve", help="Run flask_app with a stand-in LLM")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=5001)
+    p_serve.add_argument("--llm-latency", type=float, default=1.0, help="Mean stand-in LLM latency (s)")
+    p_serve.add_argument("--llm-jitter", type=float, default=0.25, help="Std deviation of LLM latency (s)")
+    p_serve.add_argument("--answer-chars", type=int, default=600)
+    p_serve.add_argument("--fake-embeddings", action="store_true",
+                         help="Use deterministic hash embeddings instead of the sentence-transformers model")
+    p_serve.add_argument("--keep-rate-limits", action="store_true",
+                         help="Keep per-session rate limits (disabled by default so capacity is measured)")
+    p_serve.set_defaults(func=serve)
+
+    p_run = sub.add_parser("run", help="Sweep concurrency levels against a running server")
+    p_run.add_argument("--url", default="http://127.0.0.1:5001")
+    p_run.add_argument("--levels", default="1,2,4,8,16,32")
+    p_run.add_argument("--duration", type=float, default=30, help="Seconds per concurrency level")
+    p_run.add_argument("--turns", type=int, default=5, help="Chat turns per session")
+    p_run.add_argument("--think-time", type=float, default=1.0, help="Mean pause between turns (s)")
+    p_run.add_argument("--document", help="PDF/DOCX to upload (default: generated DOCX)")
+    p_run.add_argument("--doc-repeat", type=int, default=20, help="Repetitions of the generated text")
+    p_run.add_argument("--p99-limit-ms", type=float, default=5000)
+    p_run.add_argument("--error-limit", type=float, default=0.01)
+    p_run.add_argument("--output", default="loadtest_report.json")
+    p_run.set_defaults(func=run)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
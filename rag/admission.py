@@ -0,0 +1,128 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Rejected(Exception):
+    """Base class for requests turned away before doing any work."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class Overloaded(Rejected):
+    """All slots are busy and the wait queue is full or timed out (HTTP 503)."""
+
+
+class RateLimited(Rejected):
+    """The caller exceeded its token-bucket rate (HTTP 429)."""
+
+
+class ConcurrencyLimiter:
+    """
+    Bounded number of concurrent slots with a short, bounded wait queue.
+    Requests beyond the queue are rejected immediately instead of piling up.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, timeout: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._admitted = 0
+        self._rejected = 0
+
+    @contextmanager
+    def slot(self):
+        self._acquire()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify()
+
+    def _acquire(self):
+        with self._cond:
+            if self._active < self.max_concurrent and self._waiting == 0:
+                self._active += 1
+                self._admitted += 1
+                return
+            if self._waiting >= self.max_queue:
+                self._rejected += 1
+                raise Overloaded(f"{self.name} is saturated, please retry shortly.", self.timeout)
+
+            self._waiting += 1
+            deadline = time.monotonic() + self.timeout
+            try:
+                while self._active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected += 1
+                        raise Overloaded(f"Timed out waiting for {self.name}, please retry shortly.", self.timeout)
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._active += 1
+            self._admitted += 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                "active": self._active,
+                "queued": self._waiting,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "admitted_total": self._admitted,
+                "rejected_total": self._rejected,
+            }
+
+
+class RateLimiter:
+    """
+    Per-key token buckets refilling at `rate` tokens per second up to `burst`.
+    Buckets idle long enough to be full again are dropped to bound memory.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._last_sweep = time.monotonic()
+        self._limited = 0
+
+    def check(self, key: str):
+        """Consume one token for `key` or raise RateLimited."""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                self._limited += 1
+                raise RateLimited("Too many requests, please slow down.", (1 - tokens) / self.rate)
+            self._buckets[key] = (tokens - 1, now)
+            self._sweep(now)
+
+    def _sweep(self, now: float):
+        idle = self.burst / self.rate
+        if now - self._last_sweep < idle:
+            return
+        self._last_sweep = now
+        self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < idle}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tracked_sessions": len(self._buckets),
+                "rate_per_sec": self.rate,
+                "burst": self.burst,
+                "limited_total": self._limited,
+            }
@@ -5,6 +5,37 @@ load_dotenv()
 
 HF_TOKEN = os.getenv("HUGGINGFACEHUB_API_TOKEN", "").strip()
 HF_LLM_REPO_ID = os.getenv("HF_LLM_REPO_ID", "mistralai/Mistral-7B-Instruct-v0.2").strip()
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2").strip()
 
 UPLOAD_DIR = "storage/uploads"
 CHROMA_DIR = "storage/chroma"
+# Parsed page text per uploaded file, keyed by content hash and loader version
+TEXT_CACHE_DIR = "storage/text_cache"
+
+# Shared secret required by the /export endpoints; export is disabled when unset
+EXPORT_API_TOKEN = os.getenv("EXPORT_API_TOKEN", "").strip()
+
+# Admission control for LLM calls (/chat) and document ingestion (/process_documents)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "8"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+INGEST_MAX_CONCURRENCY = int(os.getenv("INGEST_MAX_CONCURRENCY", "1"))
+INGEST_MAX_QUEUE = int(os.getenv("INGEST_MAX_QUEUE", "2"))
+INGEST_QUEUE_TIMEOUT = float(os.getenv("INGEST_QUEUE_TIMEOUT", "30"))
+
+# Per-session token buckets: sustained requests per second and burst size (0 disables)
+CHAT_RATE_PER_SEC = float(os.getenv("CHAT_RATE_PER_SEC", "0.5"))
+CHAT_RATE_BURST = int(os.getenv("CHAT_RATE_BURST", "5"))
+INGEST_RATE_PER_SEC = float(os.getenv("INGEST_RATE_PER_SEC", "0.1"))
+INGEST_RATE_BURST = int(os.getenv("INGEST_RATE_BURST", "3"))
+
+# Collections that reach this many chunks are split into SHARD_COUNT shards by source document
+SHARD_MIN_CHUNKS = int(os.getenv("SHARD_MIN_CHUNKS", "5000"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", str(min(8, os.cpu_count() or 1))))
+
+# Superseded index versions are kept this long so in-flight reads can finish
+INDEX_GC_GRACE_SECONDS = float(os.getenv("INDEX_GC_GRACE_SECONDS", "300"))
+
+# Streaming ingestion: chunks per embedding/write batch, and batches buffered between stages
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", "4"))
@@ -46,6 +46,11 @@ def init_db():
         )
         """)
 
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_messages_created ON messages(created_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_queries_session ON queries(session_id, id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_queries_created ON queries(created_at)")
+
         conn.commit()
 
 def create_session(session_id: str):
@@ -80,6 +85,19 @@ def log_query(session_id: str, question: str, answer: str):
         )
         conn.commit()
 
+def list_document_sessions():
+    with sqlite3.connect(DB_PATH) as conn:
+        rows = conn.execute("SELECT DISTINCT session_id FROM documents ORDER BY session_id").fetchall()
+    return [row[0] for row in rows]
+
+def get_session_documents(session_id: str):
+    with sqlite3.connect(DB_PATH) as conn:
+        rows = conn.execute(
+            "SELECT filename, filepath FROM documents WHERE session_id=? ORDER BY id",
+            (session_id,),
+        ).fetchall()
+    return rows
+
 def get_recent_messages(session_id: str, limit: int = 10):
     with sqlite3.connect(DB_PATH) as conn:
         cur = conn.cursor()
@@ -89,3 +107,90 @@ def get_recent_messages(session_id: str, limit: int = 10):
         )
         rows = cur.fetchall()
     return list(reversed(rows))
+
+
+EXPORT_COLUMNS = {
+    "messages": ("id", "session_id", "role", "content", "created_at"),
+    "queries": ("id", "session_id", "question", "answer", "created_at"),
+}
+
+def _history_filters(session_id=None, since=None, until=None):
+    clauses, params = [], []
+    if session_id:
+        clauses.append("session_id = ?")
+        params.append(session_id)
+    if since:
+        clauses.append("created_at >= ?")
+        params.append(since)
+    if until:
+        clauses.append("created_at < ?")
+        params.append(until)
+    return clauses, params
+
+def iter_history(table: str, session_id: str = None, since: str = None, until: str = None,
+                 after_id: int = 0, page_size: int = 500):
+    """
+    Yield rows of `messages` or `queries` as dicts in id order.
+
+    Uses keyset pagination (WHERE id > last_id) so every page is an index
+    seek, and each page is read through the cursor with fetchmany on a
+    short-lived connection, so memory and read locks stay bounded.
+    """
+    if table not in EXPORT_COLUMNS:
+        raise ValueError(f"Unknown table: {table}")
+    if page_size < 1:
+        # LIMIT 0 never advances and LIMIT -1 means no limit, so either would loop forever
+        raise ValueError(f"page_size must be at least 1, got {page_size}")
+    columns = EXPORT_COLUMNS[table]
+    clauses, params = _history_filters(session_id, since, until)
+    where = " AND ".join(["id > ?"] + clauses)
+    sql = f"SELECT {', '.join(columns)} FROM {table} WHERE {where} ORDER BY id LIMIT ?"
+
+    last_id = after_id or 0
+    while True:
+        fetched = 0
+        with sqlite3.connect(DB_PATH) as conn:
+            cur = conn.execute(sql, [last_id] + params + [page_size])
+            while True:
+                rows = cur.fetchmany(100)
+                if not rows:
+                    break
+                for row in rows:
+                    fetched += 1
+                    last_id = row[0]
+                    yield dict(zip(columns, row))
+        if fetched < page_size:
+            return
+
+def get_query_stats(session_id: str = None, since: str = None, until: str = None):
+    """
+    Aggregate query statistics computed inside SQLite, so no rows are loaded.
+    """
+    clauses, params = _history_filters(session_id, since, until)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with sqlite3.connect(DB_PATH) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"""SELECT COUNT(*), COUNT(DISTINCT session_id),
+                       AVG(LENGTH(question)), AVG(LENGTH(answer))
+                FROM queries {where}""",
+            params,
+        )
+        total, sessions, avg_question, avg_answer = cur.fetchone()
+        cur.execute(
+            f"""SELECT substr(created_at, 1, 10) AS day, COUNT(*), AVG(LENGTH(answer))
+                FROM queries {where}
+                GROUP BY day ORDER BY day""",
+            params,
+        )
+        per_day = [
+            {"day": day, "queries": count, "avg_answer_length": round(avg or 0, 1)}
+            for day, count, avg in cur.fetchall()
+        ]
+    return {
+        "total_queries": total,
+        "sessions": sessions,
+        "avg_question_length": round(avg_question or 0, 1),
+        "avg_answer_length": round(avg_answer or 0, 1),
+        "queries_per_day": per_day,
+    }
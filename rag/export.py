@@ -0,0 +1,33 @@
+import csv
+import io
+import json
+
+from rag.db import EXPORT_COLUMNS, iter_history
+
+EXPORT_FORMATS = ("ndjson", "csv")
+
+
+def stream_history(table: str, fmt: str = "ndjson", **filters):
+    """
+    Yield `table` rows encoded as NDJSON lines or CSV rows (header first).
+    Rows are encoded one at a time so output size never affects memory.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    rows = iter_history(table, **filters)
+    if fmt == "ndjson":
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS[table])
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue()
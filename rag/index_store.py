@@ -0,0 +1,373 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process locking only
+    fcntl = None
+
+from rag.config import INDEX_GC_GRACE_SECONDS
+from rag.sharding import MANIFEST_NAME, shard_for
+from rag.scoping import METADATA_INDEX_NAME, update_metadata_index
+
+# Layout of storage/chroma/<session_id>/:
+#   CURRENT            name of the live version, swapped atomically with os.replace
+#   versions/<id>/     complete, immutable index versions (flat or sharded)
+#   .write.lock        serialises writers across processes
+# Sessions built before versioning keep their index at the top level until first rebuilt.
+CURRENT_NAME = "CURRENT"
+VERSIONS_DIR = "versions"
+LOCK_NAME = ".write.lock"
+RETIRED_NAME = "RETIRED"
+LEGACY_RETIRED_NAME = "LEGACY_RETIRED"
+COLLECTION_NAME = "langchain"  # langchain's Chroma default, so load_vectorstore finds it
+_CONTROL_NAMES = {CURRENT_NAME, VERSIONS_DIR, LOCK_NAME, LEGACY_RETIRED_NAME, f"{CURRENT_NAME}.tmp"}
+
+_locks_guard = threading.Lock()
+_thread_locks = {}
+
+
+def _legacy_entries(session_dir: Path):
+    return [p for p in session_dir.iterdir() if p.name not in _CONTROL_NAMES]
+
+
+def current_index_dir(session_dir: str):
+    """
+    Directory holding the live index for a session, or None if it has none.
+    Readers resolve this once per request and keep using that version even
+    if a writer publishes a newer one meanwhile.
+    """
+    session_dir = Path(session_dir)
+    pointer = session_dir / CURRENT_NAME
+    if pointer.exists():
+        return session_dir / VERSIONS_DIR / pointer.read_text().strip()
+    if (session_dir / "chroma.sqlite3").exists() or (session_dir / "shards.json").exists():
+        return session_dir
+    return None
+
+
+def resolve_index_dir(persist_dir: str) -> str:
+    """Session directory -> live version directory; any other directory is returned unchanged."""
+    current = current_index_dir(persist_dir) if Path(persist_dir).exists() else None
+    return str(current) if current is not None else str(persist_dir)
+
+
+def index_exists(session_dir: str) -> bool:
+    return Path(session_dir).exists() and current_index_dir(session_dir) is not None
+
+
+@contextmanager
+def writer_lock(session_dir: str):
+    """One writer per session: a thread lock within the process plus flock across processes."""
+    session_dir = Path(session_dir)
+    session_dir.mkdir(parents=True, exist_ok=True)
+    key = str(session_dir.resolve())
+    with _locks_guard:
+        thread_lock = _thread_locks.setdefault(key, threading.Lock())
+    with thread_lock:
+        with open(session_dir / LOCK_NAME, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def new_version_name() -> str:
+    # Sortable by creation time, unique across processes
+    return f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:  # filesystem without hard links
+        shutil.copy2(src, dst)
+
+
+def _unshare(directory: Path):
+    """Replace hard-linked files under `directory` with private copies before writing to them."""
+    for path in directory.rglob("*"):
+        if path.is_file() and path.stat().st_nlink > 1:
+            tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+            shutil.copy2(path, tmp)
+            os.replace(tmp, path)
+
+
+def _clone(src: Path, dst: Path, link: bool = False):
+    copy = _link_or_copy if link else shutil.copy2
+    if src.is_dir():
+        shutil.copytree(src, dst, copy_function=copy, ignore=shutil.ignore_patterns(RETIRED_NAME))
+    else:
+        copy(src, dst)
+
+
+def new_version_dir(session_dir: str, copy_current: bool = True, sources=None) -> Path:
+    """
+    Create an unpublished version directory, seeded with the live index so
+    new chunks are added on top of it. Call under writer_lock.
+
+    A flat index is copied whole. For a sharded index, pass the `sources`
+    about to be added: only the shards they map to are copied, and the
+    rest are hard-linked, since versions are immutable and those shards
+    are never written. Without `sources` every shard is copied.
+    """
+    session_dir = Path(session_dir)
+    version_dir = session_dir / VERSIONS_DIR / new_version_name()
+    version_dir.mkdir(parents=True)
+    current = current_index_dir(session_dir)
+    if not copy_current or current is None:
+        return version_dir
+
+    if current == session_dir:
+        entries = _legacy_entries(session_dir)
+    else:
+        entries = [entry for entry in current.iterdir() if entry.name != RETIRED_NAME]
+    manifest_path = current / MANIFEST_NAME
+    touched = None
+    if sources is not None and manifest_path.exists():
+        num_shards = json.loads(manifest_path.read_text())["num_shards"]
+        touched = {str(shard_for({"source": str(source)}, num_shards)) for source in sources}
+
+    for entry in entries:
+        if entry.name == "shards" and entry.is_dir() and touched is not None:
+            (version_dir / "shards").mkdir()
+            for shard in entry.iterdir():
+                _clone(shard, version_dir / "shards" / shard.name, link=shard.name not in touched)
+        else:
+            _clone(entry, version_dir / entry.name)
+    return version_dir
+
+
+def publish_version(session_dir: str, version_dir: Path):
+    """
+    Atomically point the session at `version_dir`, a complete index under
+    versions/, then collect old versions. Call under writer_lock.
+    """
+    session_dir = Path(session_dir)
+    version_dir = Path(version_dir)
+    previous = current_index_dir(session_dir)
+    tmp = session_dir / f"{CURRENT_NAME}.tmp"
+    tmp.write_text(version_dir.name)
+    os.replace(tmp, session_dir / CURRENT_NAME)
+
+    retired_at = str(time.time())
+    if previous == session_dir:
+        (session_dir / LEGACY_RETIRED_NAME).write_text(retired_at)
+    elif previous is not None:
+        (previous / RETIRED_NAME).write_text(retired_at)
+    collect_garbage(session_dir)
+
+
+def collect_garbage(session_dir: str, grace_seconds: float = INDEX_GC_GRACE_SECONDS):
+    """
+    Delete versions retired more than `grace_seconds` ago, plus unpublished
+    leftovers from crashed builds. The grace period lets requests that
+    resolved an old version finish reading it.
+    """
+    session_dir = Path(session_dir)
+    current = current_index_dir(session_dir)
+    now = time.time()
+
+    def expired(marker: Path):
+        try:
+            return now - float(marker.read_text()) > grace_seconds
+        except (OSError, ValueError):
+            return False
+
+    versions = session_dir / VERSIONS_DIR
+    if versions.exists():
+        for version in versions.iterdir():
+            if version == current:
+                continue
+            marker = version / RETIRED_NAME
+            unpublished = not marker.exists() and now - version.stat().st_mtime > grace_seconds
+            if expired(marker) or unpublished:
+                evict_clients(version)
+                shutil.rmtree(version, ignore_errors=True)
+
+    legacy_marker = session_dir / LEGACY_RETIRED_NAME
+    if current != session_dir and legacy_marker.exists() and expired(legacy_marker):
+        evict_clients(session_dir, recursive=False)
+        for entry in _legacy_entries(session_dir):
+            evict_clients(entry)
+            if entry.is_dir():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+        legacy_marker.unlink(missing_ok=True)
+
+
+def collection_dirs(root):
+    """Chroma directories holding an index version: the version root, or one per shard."""
+    if root is None:
+        return []
+    root = Path(root)
+    manifest_path = root / MANIFEST_NAME
+    if manifest_path.exists():
+        num_shards = json.loads(manifest_path.read_text())["num_shards"]
+        return [root / "shards" / str(i) for i in range(num_shards)]
+    return [root] if (root / "chroma.sqlite3").exists() else []
+
+
+def backfill_metadata_index(index_dir):
+    """
+    Build the per-file metadata index of an index built before it existed;
+    no-op when the index is missing or already has one. Needs no lock:
+    readers may race to build it, and whichever complete file lands first wins.
+    """
+    if (Path(index_dir) / METADATA_INDEX_NAME).exists():
+        return
+    dirs = collection_dirs(index_dir)
+    if not dirs:
+        return
+    metadatas = []
+    for path in dirs:
+        _, collection = open_collection(str(path))
+        metadatas.extend(collection.get(include=["metadatas"])["metadatas"])
+    update_metadata_index(str(index_dir), metadatas, only_if_missing=True)
+
+
+def ensure_metadata_index(session_dir: str, index_dir=None):
+    """
+    Backfill the metadata index of the live (or given) version for sessions
+    indexed before it existed. Never takes the writer lock, so reads are not
+    held up by an upload in the same session.
+    """
+    index_dir = index_dir or current_index_dir(session_dir)
+    if index_dir is not None:
+        backfill_metadata_index(index_dir)
+
+
+def open_collection(path: str, create: bool = False, metadata: dict = None):
+    import chromadb
+    client = chromadb.PersistentClient(path=path)
+    if create:
+        return client, client.get_or_create_collection(COLLECTION_NAME, metadata=metadata)
+    return client, client.get_collection(COLLECTION_NAME)
+
+
+def evict_clients(path, recursive: bool = True):
+    """
+    Stop and forget chromadb's cached systems for `path` (and, if recursive,
+    any directory below it). chromadb keeps one system with open SQLite
+    handles per directory for the life of the process, so a version must be
+    evicted before it is moved or deleted, or it stays in memory and on disk.
+    """
+    try:
+        from chromadb.api.client import SharedSystemClient
+    except ImportError:
+        return
+    cache = getattr(SharedSystemClient, "_identifer_to_system", None)
+    if not cache:
+        return
+    root = os.path.realpath(path)
+    for identifier in list(cache):
+        resolved = os.path.realpath(identifier) if identifier else ""
+        if resolved == root or (recursive and resolved.startswith(root + os.sep)):
+            system = cache.pop(identifier, None)
+            if system is not None:
+                system.stop()
+
+
+class IndexWriter:
+    """
+    Writes pre-computed embeddings into an unpublished index directory,
+    flat or sharded by source document according to `manifest`.
+    """
+
+    def __init__(self, staging: Path, manifest: dict = None, metadata: dict = None):
+        self.manifest = manifest
+        self.metadata = metadata
+        staging.mkdir(parents=True, exist_ok=True)
+        if manifest:
+            (staging / MANIFEST_NAME).write_text(json.dumps(manifest))
+            dirs = [staging / "shards" / str(i) for i in range(manifest["num_shards"])]
+        else:
+            dirs = [staging]
+        self.dirs = dirs
+        # Writers to different shards run in parallel; writes to one collection are serialised
+        self.locks = [threading.Lock() for _ in dirs]
+        self.targets = [None] * len(dirs)
+        for i, target in enumerate(dirs):
+            # Create missing collections now so every shard is readable; existing ones
+            # (possibly hard-linked from the previous version) are only opened when written
+            if not (target / "chroma.sqlite3").exists():
+                self._collection(i)
+
+    def _collection(self, i: int):
+        with self.locks[i]:
+            if self.targets[i] is None:
+                self.dirs[i].mkdir(parents=True, exist_ok=True)
+                # Copy-on-write for shards new_version_dir hard-linked from the live version
+                _unshare(self.dirs[i])
+                self.targets[i] = open_collection(str(self.dirs[i]), create=True, metadata=self.metadata)
+            return self.targets[i][1]
+
+    def upsert(self, ids, embeddings, texts, metadatas):
+        groups = {}
+        for row in zip(ids, embeddings, texts, metadatas):
+            shard = shard_for(row[3], len(self.dirs)) if self.manifest else 0
+            groups.setdefault(shard, []).append(row)
+        for shard, rows in groups.items():
+            ids, embeddings, texts, metadatas = zip(*rows)
+            collection = self._collection(shard)
+            with self.locks[shard]:
+                collection.upsert(
+                    ids=list(ids),
+                    embeddings=list(embeddings),
+                    documents=list(texts),
+                    metadatas=[m or None for m in metadatas],
+                )
+
+    def count(self) -> int:
+        return sum(self._collection(i).count() for i in range(len(self.dirs)))
+
+    def write_metadata_index(self, staging: Path):
+        """Rebuild the per-file metadata index from what was actually written."""
+        (staging / METADATA_INDEX_NAME).unlink(missing_ok=True)
+        metadatas = []
+        for i in range(len(self.dirs)):
+            metadatas.extend(self._collection(i).get(include=["metadatas"])["metadatas"])
+        update_metadata_index(str(staging), metadatas)
+
+    def close(self):
+        for target, opened in zip(self.dirs, self.targets):
+            if opened is not None:
+                evict_clients(target)
+
+
+def reshard(session_dir: str, flat_dir: Path, num_shards: int, page_size: int = 1000) -> Path:
+    """
+    Copy an unpublished flat version into a new version split into
+    `num_shards` shards by source document, reusing the stored embeddings,
+    and delete the flat one. Returns the new version. Call under writer_lock.
+    """
+    target = new_version_dir(session_dir, copy_current=False)
+    _, collection = open_collection(str(flat_dir))
+    writer = IndexWriter(target, {"num_shards": num_shards}, collection.metadata)
+    try:
+        offset = 0
+        while True:
+            page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            writer.upsert(page["ids"], page["embeddings"], page["documents"], page["metadatas"])
+            offset += page_size
+        if (Path(flat_dir) / METADATA_INDEX_NAME).exists():
+            shutil.copy2(Path(flat_dir) / METADATA_INDEX_NAME, target / METADATA_INDEX_NAME)
+    except BaseException:
+        writer.close()
+        shutil.rmtree(target, ignore_errors=True)
+        raise
+    evict_clients(flat_dir)
+    shutil.rmtree(flat_dir, ignore_errors=True)
+    return target
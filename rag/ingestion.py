@@ -1,15 +1,91 @@
+import gzip
+import hashlib
+import json
+import os
+import uuid
+import zlib
+from pathlib import Path
+
 from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.schema import Document
+
+from rag.config import TEXT_CACHE_DIR
+
+# Bump when loader behaviour changes so stale cached text is not reused
+LOADER_VERSIONS = {
+    ".pdf": "pypdf-1",
+    ".docx": "docx2txt-1",
+}
 
-def load_documents(file_path: str):
+def _loader_key(file_path: str):
     lower = file_path.lower()
-    if lower.endswith(".pdf"):
+    for ext, version in LOADER_VERSIONS.items():
+        if lower.endswith(ext):
+            return ext, version
+    raise ValueError("Only PDF and DOCX are supported.")
+
+def file_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def text_cache_path(file_path: str) -> Path:
+    _, version = _loader_key(file_path)
+    return Path(TEXT_CACHE_DIR) / f"{file_hash(file_path)}-{version}.jsonl.gz"
+
+def _read_text_cache(cache_path: Path, file_path: str):
+    docs = []
+    with gzip.open(cache_path, "rt", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            metadata = record["metadata"]
+            # Same content may be uploaded under another path; point at the current one
+            metadata["source"] = file_path
+            docs.append(Document(page_content=record["page_content"], metadata=metadata))
+    return docs
+
+def _write_text_cache(cache_path: Path, docs):
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for doc in docs:
+                f.write(json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}, ensure_ascii=False))
+                f.write("\n")
+        os.replace(tmp_path, cache_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+def load_documents(file_path: str, use_cache: bool = True):
+    """
+    Parse a PDF/DOCX into page documents. Extracted text is cached as
+    gzipped JSONL keyed by content hash and loader version, so re-chunking
+    or reindexing the same file never parses the binary again.
+    """
+    ext, _ = _loader_key(file_path)
+    cache_path = text_cache_path(file_path) if use_cache else None
+    if cache_path is not None and cache_path.exists():
+        try:
+            return _read_text_cache(cache_path, file_path)
+        except (OSError, EOFError, zlib.error, ValueError, KeyError, TypeError) as e:
+            # Truncated or corrupt entry: treat as a miss and rewrite it below
+            print(f"Ignoring unreadable text cache {cache_path}: {str(e)}")
+
+    if ext == ".pdf":
         loader = PyPDFLoader(file_path)
-    elif lower.endswith(".docx"):
-        loader = Docx2txtLoader(file_path)
     else:
-        raise ValueError("Only PDF and DOCX are supported.")
-    return loader.load()
+        loader = Docx2txtLoader(file_path)
+    docs = loader.load()
+
+    if cache_path is not None:
+        try:
+            _write_text_cache(cache_path, docs)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Could not write text cache {cache_path}: {str(e)}")
+    return docs
 
 def chunk_documents(docs, chunk_size: int = 800, chunk_overlap: int = 150):
     splitter = RecursiveCharacterTextSplitter(
@@ -0,0 +1,214 @@
+import queue
+import shutil
+import threading
+import uuid
+
+from rag.config import INGEST_BATCH_SIZE, INGEST_QUEUE_DEPTH, SHARD_COUNT, SHARD_MIN_CHUNKS
+from rag.ingestion import load_documents, chunk_documents
+from rag.index_store import (IndexWriter, backfill_metadata_index, evict_clients, new_version_dir, publish_version,
+                             reshard, writer_lock)
+from rag.retrieval import get_embeddings
+from rag.scoping import update_metadata_index
+from rag.sharding import read_manifest, shard_for
+
+_DONE = object()
+
+
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _drain(q, stop):
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def _start_stage(name, produce, outbox, stop, errors):
+    """Run `produce()` on its own thread, feeding each item into the bounded `outbox`."""
+    def run():
+        try:
+            for item in produce():
+                if not _put(outbox, item, stop):
+                    return
+            _put(outbox, _DONE, stop)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    thread = threading.Thread(target=run, name=f"ingest-{name}", daemon=True)
+    thread.start()
+    return thread
+
+
+def _start_worker(name, consume, inbox, stop, errors):
+    """Run `consume(item)` on its own thread for every item taken from the bounded `inbox`."""
+    def run():
+        try:
+            for item in _drain(inbox, stop):
+                consume(item)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    thread = threading.Thread(target=run, name=f"ingest-{name}", daemon=True)
+    thread.start()
+    return thread
+
+
+def _index_stream(persist_dir: str, sources, start_upstream, embeddings, batch_size: int, queue_depth: int) -> int:
+    """
+    Write the chunk batches produced by `start_upstream(chunks_q, stop, errors)`
+    into a new version of the session index and publish it. On a sharded
+    index chunks are routed by source document to one embed/write worker per
+    shard, so shards are persisted in parallel and overlap embedding; a flat
+    index has a single worker. Only one embed_documents call runs at a time:
+    torch already spreads one encode over every core, and the shared fast
+    tokenizer is not thread-safe. A flat index that reaches SHARD_MIN_CHUNKS is converted to shards before
+    publishing. `sources` are the source paths about to be added, so a
+    sharded version only copies the shards they land in. Returns the number
+    of chunks written.
+    """
+    stop = threading.Event()
+    errors = []
+    chunks_q = queue.Queue(maxsize=queue_depth)
+    written = 0
+
+    with writer_lock(persist_dir):
+        version_dir = new_version_dir(persist_dir, sources=sources)
+        manifest = read_manifest(str(version_dir))
+        num_workers = manifest["num_shards"] if manifest else 1
+        threads = start_upstream(chunks_q, stop, errors)
+        writer = None
+        published = False
+        try:
+            # Seeded from an index built before metadata_index.json existed: index its files first
+            backfill_metadata_index(version_dir)
+            writer = IndexWriter(version_dir, manifest)
+
+            embed_lock = threading.Lock()
+
+            def embed_and_write(batch):
+                with embed_lock:
+                    vectors = embeddings.embed_documents([piece.page_content for piece in batch])
+                writer.upsert(
+                    [str(uuid.uuid4()) for _ in batch],
+                    vectors,
+                    [piece.page_content for piece in batch],
+                    [piece.metadata for piece in batch],
+                )
+
+            inboxes = [queue.Queue(maxsize=queue_depth) for _ in range(num_workers)]
+            threads += [_start_worker(f"embed-{i}", embed_and_write, inboxes[i], stop, errors)
+                        for i in range(num_workers)]
+            pending = [[] for _ in range(num_workers)]
+            for batch in _drain(chunks_q, stop):
+                update_metadata_index(str(version_dir), [piece.metadata for piece in batch])
+                written += len(batch)
+                if not manifest:
+                    _put(inboxes[0], batch, stop)
+                    continue
+                # Same routing as IndexWriter, so worker i only ever writes shard i
+                for piece in batch:
+                    worker = shard_for(piece.metadata, num_workers)
+                    pending[worker].append(piece)
+                    if len(pending[worker]) == batch_size:
+                        _put(inboxes[worker], pending[worker], stop)
+                        pending[worker] = []
+            for inbox, rest in zip(inboxes, pending):
+                if rest:
+                    _put(inbox, rest, stop)
+                _put(inbox, _DONE, stop)
+            for thread in threads:
+                thread.join()
+            if errors:
+                raise errors[0]
+
+            if written:
+                if manifest is None and SHARD_COUNT > 1 and writer.count() >= SHARD_MIN_CHUNKS:
+                    writer.close()
+                    writer = None
+                    version_dir = reshard(persist_dir, version_dir, SHARD_COUNT)
+                publish_version(persist_dir, version_dir)
+                published = True
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            if not published:
+                if writer is not None:
+                    writer.close()
+                evict_clients(version_dir)
+                shutil.rmtree(version_dir, ignore_errors=True)
+    return written
+
+
+def ingest_files(paths, persist_dir: str, embeddings=None, chunk_size: int = 800, chunk_overlap: int = 150,
+                 batch_size: int = INGEST_BATCH_SIZE, queue_depth: int = INGEST_QUEUE_DEPTH):
+    """
+    Parse, chunk, embed and persist `paths` into the session index as a
+    pipeline: loading, chunking and embedding/writing run on their own
+    threads (one writer per shard), with bounded queues between them, so PDF
+    parsing overlaps embedding and at most `queue_depth` items are buffered
+    per stage however large the upload. The result is published as a new
+    index version. Returns file, page and chunk counts.
+    """
+    embeddings = embeddings or get_embeddings()
+    stats = {"files": 0, "pages": 0, "chunks": 0}
+
+    def start_upstream(chunks_q, stop, errors):
+        pages_q = queue.Queue(maxsize=queue_depth)
+
+        def load():
+            for path in paths:
+                docs = load_documents(path)
+                stats["files"] += 1
+                stats["pages"] += len(docs)
+                yield docs
+
+        def chunk():
+            batch = []
+            for docs in _drain(pages_q, stop):
+                for piece in chunk_documents(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap):
+                    batch.append(piece)
+                    if len(batch) == batch_size:
+                        yield batch
+                        batch = []
+            if batch and not stop.is_set():
+                yield batch
+
+        return [
+            _start_stage("load", load, pages_q, stop, errors),
+            _start_stage("chunk", chunk, chunks_q, stop, errors),
+        ]
+
+    # Loaders record the path they were given as each page's source
+    stats["chunks"] = _index_stream(persist_dir, paths, start_upstream, embeddings, batch_size, queue_depth)
+    return stats
+
+
+def index_chunks(chunks, persist_dir: str, embeddings=None,
+                 batch_size: int = INGEST_BATCH_SIZE, queue_depth: int = INGEST_QUEUE_DEPTH) -> int:
+    """Embed and persist already-chunked documents through the same workers as ingest_files."""
+    embeddings = embeddings or get_embeddings()
+
+    def start_upstream(chunks_q, stop, errors):
+        def batches():
+            for start in range(0, len(chunks), batch_size):
+                yield chunks[start:start + batch_size]
+
+        return [_start_stage("chunks", batches, chunks_q, stop, errors)]
+
+    sources = {(chunk.metadata or {}).get("source", "") for chunk in chunks}
+    return _index_stream(persist_dir, sources, start_upstream, embeddings, batch_size, queue_depth)
@@ -0,0 +1,294 @@
+import json
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from rag.config import CHROMA_DIR, UPLOAD_DIR
+from rag.db import list_document_sessions, get_session_documents
+from rag.sharding import read_manifest
+from rag.index_store import (VERSIONS_DIR, IndexWriter, collection_dirs, current_index_dir, evict_clients,
+                             new_version_name, open_collection, publish_version, writer_lock)
+
+REINDEX_DIR = "storage/reindex"
+LEGACY_VERSION = "legacy"  # sessions still indexed at the top level of their directory
+MAX_ATTEMPTS = 3
+
+_worker_embeddings = None
+
+
+def _init_worker(model_name: str):
+    global _worker_embeddings
+    from rag.retrieval import get_embeddings
+    _worker_embeddings = get_embeddings(model_name)
+
+
+def _embed_batch(texts):
+    return _worker_embeddings.embed_documents(texts)
+
+
+def discover_sessions():
+    """Sessions with uploaded documents in the database or data on disk."""
+    sessions = set(list_document_sessions())
+    for base in (CHROMA_DIR, UPLOAD_DIR):
+        if Path(base).exists():
+            sessions.update(p.name for p in Path(base).iterdir() if p.is_dir())
+    return sorted(sessions)
+
+
+def _session_files(session_id: str):
+    paths = [path for _, path in get_session_documents(session_id)]
+    upload_dir = Path(UPLOAD_DIR) / session_id
+    if upload_dir.exists():
+        paths.extend(str(p) for p in sorted(upload_dir.iterdir()) if p.is_file())
+    seen, files = set(), []
+    for path in paths:
+        resolved = os.path.realpath(path)
+        if resolved in seen or not Path(path).exists():
+            continue
+        seen.add(resolved)
+        if path.lower().endswith((".pdf", ".docx")):
+            files.append(path)
+    return files
+
+
+def _live_root(session_id: str):
+    session_dir = Path(CHROMA_DIR) / session_id
+    return current_index_dir(session_dir) if session_dir.exists() else None
+
+
+def _version_name(session_id: str, root):
+    """Identifies the version a build started from; None when the session has no index."""
+    if root is None:
+        return None
+    return LEGACY_VERSION if root == Path(CHROMA_DIR) / session_id else root.name
+
+
+def iter_index_batches(root, batch_size: int, start_batch: int = 0):
+    """Yield (ids, texts, metadatas) from the index version at `root`."""
+    for index_dir in collection_dirs(root):
+        _, collection = open_collection(str(index_dir))
+        try:
+            batches_here = -(-collection.count() // batch_size)
+            if start_batch >= batches_here:
+                start_batch -= batches_here
+                continue
+            offset = start_batch * batch_size
+            start_batch = 0
+            while True:
+                page = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+                if not page["ids"]:
+                    break
+                yield page["ids"], page["documents"], page["metadatas"]
+                offset += batch_size
+        finally:
+            evict_clients(index_dir)
+
+
+def iter_upload_batches(session_id: str, batch_size: int, start_batch: int = 0,
+                        chunk_size: int = 800, chunk_overlap: int = 150):
+    """Yield (ids, texts, metadatas) re-chunked from the session's uploaded files."""
+    from rag.ingestion import load_documents, chunk_documents
+    docs = []
+    for path in _session_files(session_id):
+        docs.extend(load_documents(path))
+    chunks = chunk_documents(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    for start in range(start_batch * batch_size, len(chunks), batch_size):
+        batch = chunks[start:start + batch_size]
+        ids = [f"{session_id}-{start + i}" for i in range(len(batch))]
+        yield ids, [c.page_content for c in batch], [c.metadata for c in batch]
+
+
+class SourceChanged(RuntimeError):
+    """The session published a new index version after the rebuild started."""
+
+
+def _embed_in_order(pool, batches, depth: int):
+    """Keep up to `depth` batches embedding in the pool; yield results in submission order."""
+    in_flight = deque()
+    for ids, texts, metadatas in batches:
+        in_flight.append((ids, texts, metadatas, pool.submit(_embed_batch, texts)))
+        if len(in_flight) >= depth:
+            ids, texts, metadatas, future = in_flight.popleft()
+            yield ids, texts, metadatas, future.result()
+    while in_flight:
+        ids, texts, metadatas, future = in_flight.popleft()
+        yield ids, texts, metadatas, future.result()
+
+
+class Checkpoint:
+    """Per-session progress persisted as JSON after every batch."""
+
+    def __init__(self, path: Path, settings: dict, restart: bool = False):
+        self.path = path
+        self.state = {"settings": settings, "sessions": {}}
+        if path.exists() and not restart:
+            state = json.loads(path.read_text())
+            if state.get("settings") != settings:
+                raise ValueError(
+                    f"Checkpoint {path} was written with different settings {state.get('settings')}; "
+                    "rerun with --restart to discard it."
+                )
+            self.state = state
+        self.save()
+
+    def session(self, session_id: str):
+        return self.state["sessions"].setdefault(
+            session_id, {"status": "pending", "batches_done": 0, "chunks": 0, "seconds": 0.0}
+        )
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.state, indent=2))
+        os.replace(tmp, self.path)
+
+
+def swap_index(session_id: str, staging: Path, progress: dict, checkpoint: Checkpoint):
+    """
+    Move the rebuilt index under the session's versions/ and publish it with
+    the same atomic pointer swap the app uses. The target name is
+    checkpointed first, so a crash between the two steps is repaired on resume.
+    Raises SourceChanged instead of publishing over a version the app
+    published after the rebuild started.
+    """
+    session_dir = Path(CHROMA_DIR) / session_id
+    with writer_lock(session_dir):
+        live = _version_name(session_id, current_index_dir(session_dir))
+        if "version" in progress and live == progress["version"]:
+            return  # published before a crash, status not yet saved
+        if live != progress.get("source_version"):
+            raise SourceChanged(
+                f"index changed from version {progress.get('source_version')} to {live} during the rebuild"
+            )
+        if "version" not in progress:
+            progress["version"] = new_version_name()
+            checkpoint.save()
+        target = session_dir / VERSIONS_DIR / progress["version"]
+        if staging.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.rename(staging, target)
+        if not target.exists():
+            raise RuntimeError(
+                f"Rebuilt index for {session_id} is missing from {staging} and {target}; rerun with --restart."
+            )
+        publish_version(session_dir, target)
+
+
+def _reset(progress: dict, staging: Path):
+    shutil.rmtree(staging, ignore_errors=True)
+    for key in ("source_version", "version"):
+        progress.pop(key, None)
+    progress.update(status="pending", batches_done=0, chunks=0, seconds=0.0)
+
+
+def _build_session(session_id: str, staging: Path, progress: dict, checkpoint: Checkpoint, pool, workers: int,
+                   source: str, batch_size: int, chunk_size: int, chunk_overlap: int, collection_metadata):
+    """Embed the session into `staging`, resuming from the checkpoint; sets status to built or skipped."""
+    root = _live_root(session_id)
+    if progress["status"] == "pending":
+        # Pin the version this build reads; swap_index refuses to publish if it is no longer live
+        progress["source_version"] = _version_name(session_id, root)
+    if source == "index" and not collection_dirs(root):
+        print(f"[{session_id}] no existing index, skipping")
+        progress["status"] = "skipped"
+        checkpoint.save()
+        return
+
+    progress["status"] = "building"
+    checkpoint.save()
+    if source == "index":
+        batches = iter_index_batches(root, batch_size, progress["batches_done"])
+    else:
+        batches = iter_upload_batches(session_id, batch_size, progress["batches_done"], chunk_size, chunk_overlap)
+
+    index = IndexWriter(staging, read_manifest(str(root)) if source == "index" else None, collection_metadata)
+    last = time.perf_counter()
+    try:
+        for ids, texts, metadatas, embeddings in _embed_in_order(pool, batches, workers * 2):
+            index.upsert(ids, embeddings, texts, metadatas)
+            now = time.perf_counter()
+            progress["batches_done"] += 1
+            progress["chunks"] += len(ids)
+            progress["seconds"] += now - last
+            last = now
+            checkpoint.save()
+        index.write_metadata_index(staging)
+    finally:
+        index.close()
+
+    if progress["chunks"] == 0:
+        print(f"[{session_id}] nothing to index, skipping")
+        shutil.rmtree(staging, ignore_errors=True)
+        progress["status"] = "skipped"
+    else:
+        progress["status"] = "built"
+    checkpoint.save()
+
+
+def reindex_sessions(session_ids, model_name: str, source: str = "index", batch_size: int = 256,
+                     workers: int = None, space: str = None, restart: bool = False, chunk_size: int = 800, chunk_overlap: int = 150):
+    """
+    Re-embed every session into a staging index with a process pool, then
+    swap it in. Progress is checkpointed per batch so a rerun resumes where
+    the previous run stopped. Returns a throughput report.
+    """
+    settings = {"model": model_name, "source": source, "batch_size": batch_size, "space": space,
+                "chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+    checkpoint = Checkpoint(Path(REINDEX_DIR) / "checkpoint.json", settings, restart=restart)
+    workers = workers or min(4, os.cpu_count() or 1)
+    collection_metadata = {"hnsw:space": space} if space else None
+    report = {"settings": settings, "sessions": {}}
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_name,)) as pool:
+        for session_id in session_ids:
+            progress = checkpoint.session(session_id)
+            staging = Path(REINDEX_DIR) / session_id
+            if restart and staging.exists():
+                shutil.rmtree(staging)
+
+            for _ in range(MAX_ATTEMPTS):
+                if (progress["status"] == "building"
+                        and progress.get("source_version") != _version_name(session_id, _live_root(session_id))):
+                    # Offsets in the checkpoint refer to a version that is no longer live
+                    print(f"[{session_id}] index changed since the interrupted build, starting over")
+                    _reset(progress, staging)
+                    checkpoint.save()
+
+                if progress["status"] in ("pending", "building"):
+                    _build_session(session_id, staging, progress, checkpoint, pool, workers, source,
+                                   batch_size, chunk_size, chunk_overlap, collection_metadata)
+
+                if progress["status"] == "built":
+                    try:
+                        swap_index(session_id, staging, progress, checkpoint)
+                    except SourceChanged as e:
+                        print(f"[{session_id}] {e}, rebuilding")
+                        _reset(progress, staging)
+                        checkpoint.save()
+                        continue
+                    progress["status"] = "swapped"
+                    checkpoint.save()
+                break
+            else:
+                raise SourceChanged(
+                    f"[{session_id}] index kept changing during {MAX_ATTEMPTS} rebuilds; rerun when uploads are quiet."
+                )
+
+            rate = progress["chunks"] / progress["seconds"] if progress["seconds"] else 0.0
+            report["sessions"][session_id] = {
+                "status": progress["status"],
+                "chunks": progress["chunks"],
+                "seconds": round(progress["seconds"], 2),
+                "chunks_per_sec": round(rate, 1),
+            }
+            print(f"[{session_id}] {progress['status']}: {progress['chunks']} chunks, {rate:.1f} chunks/s")
+
+    total_chunks = sum(s["chunks"] for s in report["sessions"].values())
+    total_seconds = sum(s["seconds"] for s in report["sessions"].values())
+    report["total_chunks"] = total_chunks
+    report["total_seconds"] = round(total_seconds, 2)
+    report["chunks_per_sec"] = round(total_chunks / total_seconds, 1) if total_seconds else 0.0
+    return report
@@ -1,12 +1,15 @@
 from langchain_community.vectorstores import Chroma
 from pathlib import Path
 import os
+from rag.config import EMBEDDING_MODEL
+from rag.sharding import MANIFEST_NAME, load_sharded_vectorstore
+from rag.index_store import resolve_index_dir
 
-def get_embeddings():
+def get_embeddings(model_name: str = EMBEDDING_MODEL):
     # Try to use HuggingFaceEmbeddings first, fallback to Inference API if sentence-transformers not available
     try:
         from langchain_community.embeddings import HuggingFaceEmbeddings
-        return HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+        return HuggingFaceEmbeddings(model_name=model_name)
     except (ImportError, Exception) as e:
         # Fallback to HuggingFace Inference API embeddings (requires HF token)
         try:
@@ -14,7 +17,7 @@ def get_embeddings():
             hf_token = os.getenv("HUGGINGFACEHUB_API_TOKEN", "")
             if hf_token:
                 return HuggingFaceInferenceEmbeddings(
-                    model_name="sentence-transformers/all-MiniLM-L6-v2",
+                    model_name=model_name,
                     huggingfacehub_api_token=hf_token
                 )
             else:
@@ -27,19 +30,22 @@ def get_embeddings():
                 "Could not import sentence_transformers. Please install it with: pip install sentence-transformers"
             )
 
-def build_vectorstore(chunks, persist_dir: str):
-    Path(persist_dir).mkdir(parents=True, exist_ok=True)
-    embeddings = get_embeddings()
-    vectordb = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=persist_dir
-    )
-    vectordb.persist()
-    return vectordb
+def build_vectorstore(chunks, persist_dir: str, embeddings=None):
+    """
+    Add chunks to the session index in `persist_dir`. The new index is built
+    in an unpublished version seeded from the live one and swapped in
+    atomically, so readers keep serving the old version until then.
+    """
+    from rag.pipeline import index_chunks  # the pipeline imports get_embeddings from here
+    embeddings = embeddings or get_embeddings()
+    index_chunks(chunks, persist_dir, embeddings)
+    return load_vectorstore(persist_dir, embeddings)
 
-def load_vectorstore(persist_dir: str):
-    embeddings = get_embeddings()
+def load_vectorstore(persist_dir: str, embeddings=None):
+    persist_dir = resolve_index_dir(persist_dir)
+    embeddings = embeddings or get_embeddings()
+    if (Path(persist_dir) / MANIFEST_NAME).exists():
+        return load_sharded_vectorstore(persist_dir, embeddings)
     return Chroma(
         persist_directory=persist_dir,
         embedding_function=embeddings
@@ -63,8 +69,12 @@ def get_hf_llm(hf_token: str, repo_id: str):
     )
     return ChatHuggingFace(llm=endpoint_llm)
 
-def build_qa_chain(vectordb, llm):
-    retriever = vectordb.as_retriever(search_kwargs={"k": 4})
+def build_qa_chain(vectordb, llm, search_filter=None):
+    search_kwargs = {"k": 4}
+    if search_filter:
+        # Chroma resolves the `where` filter before scoring, so only matching chunks are searched
+        search_kwargs["filter"] = search_filter
+    retriever = vectordb.as_retriever(search_kwargs=search_kwargs)
 
     # Custom QA chain that formats as conversation for Mistral
     class ConversationalQA:
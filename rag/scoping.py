@@ -0,0 +1,92 @@
+import json
+import os
+import uuid
+from pathlib import Path
+
+from werkzeug.utils import secure_filename
+
+METADATA_INDEX_NAME = "metadata_index.json"
+
+
+def load_metadata_index(persist_dir: str):
+    path = Path(persist_dir) / METADATA_INDEX_NAME
+    if not path.exists():
+        return {"files": {}}
+    return json.loads(path.read_text())
+
+
+def update_metadata_index(persist_dir: str, metadatas, only_if_missing: bool = False):
+    """
+    Fold chunk metadata into the session's small per-file index: display
+    name, page range and chunk count for every source document. With
+    `only_if_missing`, build the index from `metadatas` alone and install it
+    only if no index exists yet; the file is replaced atomically, so
+    concurrent builders of the same complete index need no lock.
+    """
+    index = {"files": {}} if only_if_missing else load_metadata_index(persist_dir)
+    for metadata in metadatas:
+        metadata = metadata or {}
+        source = str(metadata.get("source", ""))
+        entry = index["files"].setdefault(
+            source, {"filename": os.path.basename(source), "first_page": None, "last_page": None, "chunks": 0}
+        )
+        entry["chunks"] += 1
+        page = metadata.get("page")
+        if isinstance(page, int):
+            entry["first_page"] = page if entry["first_page"] is None else min(entry["first_page"], page)
+            entry["last_page"] = page if entry["last_page"] is None else max(entry["last_page"], page)
+
+    path = Path(persist_dir) / METADATA_INDEX_NAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_text(json.dumps(index, indent=2))
+    if only_if_missing and path.exists():
+        tmp.unlink()
+        return load_metadata_index(persist_dir)
+    os.replace(tmp, path)
+    return index
+
+
+def build_search_filter(persist_dir: str, filename: str = None, page_from: int = None, page_to: int = None):
+    """
+    Translate a user scope (uploaded filename and/or 1-based page range)
+    into a Chroma `where` filter, which Chroma applies before similarity
+    scoring. Returns None for an empty scope; raises ValueError when the
+    scope matches nothing in the session.
+    """
+    clauses = []
+    if filename:
+        wanted = {filename.strip().lower(), secure_filename(filename).lower()}
+        files = load_metadata_index(persist_dir)["files"]
+        sources = [source for source, entry in files.items() if entry["filename"].lower() in wanted]
+        if not sources:
+            available = ", ".join(sorted(entry["filename"] for entry in files.values())) or "none"
+            raise ValueError(f"No uploaded document named {filename}. Available: {available}.")
+        clauses.append({"source": {"$in": sources}})
+
+    # Loader page numbers are 0-based
+    if page_from is not None:
+        if page_from < 1:
+            raise ValueError("page_from must be 1 or greater.")
+        clauses.append({"page": {"$gte": page_from - 1}})
+    if page_to is not None:
+        if page_to < 1:
+            raise ValueError("page_to must be 1 or greater.")
+        if page_from is not None and page_to < page_from:
+            raise ValueError("page_to must not be before page_from.")
+        clauses.append({"page": {"$lte": page_to - 1}})
+
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def filter_sources(search_filter):
+    """Source paths a filter is restricted to, or None when it allows any source."""
+    if not search_filter:
+        return None
+    for clause in search_filter.get("$and", [search_filter]):
+        condition = clause.get("source")
+        if isinstance(condition, dict) and "$in" in condition:
+            return condition["$in"]
+    return None
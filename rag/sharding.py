@@ -0,0 +1,92 @@
+import heapq
+import json
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from langchain_community.vectorstores import Chroma
+from langchain.schema.vectorstore import VectorStore
+
+from rag.config import SHARD_COUNT
+from rag.scoping import filter_sources
+
+MANIFEST_NAME = "shards.json"
+
+# Shared by every sharded store so concurrent queries don't each spawn threads
+_fanout_pool = ThreadPoolExecutor(max_workers=max(SHARD_COUNT, 4), thread_name_prefix="shard")
+
+
+def shard_for(metadata, num_shards: int) -> int:
+    """Stable shard assignment by source document, so appends land with their siblings."""
+    source = str((metadata or {}).get("source", ""))
+    return zlib.crc32(source.encode("utf-8")) % num_shards
+
+
+def read_manifest(persist_dir: str):
+    path = Path(persist_dir) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def load_sharded_vectorstore(persist_dir: str, embeddings):
+    manifest = read_manifest(persist_dir)
+    shards = [
+        Chroma(persist_directory=str(Path(persist_dir) / "shards" / str(i)), embedding_function=embeddings)
+        for i in range(manifest["num_shards"])
+    ]
+    return ShardedVectorStore(shards, embeddings)
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    Read view over several Chroma shards. The query is embedded once, every
+    shard returns its own top-k in parallel, and the global top-k is taken
+    from the merged candidates, which gives the same result as one index.
+    """
+
+    def __init__(self, shards, embeddings):
+        self.shards = shards
+        self._embeddings = embeddings
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs):
+        embedding = self._embeddings.embed_query(query)
+        return self.similarity_search_by_vector_with_relevance_scores(embedding, k=k, **kwargs)
+
+    def _shards_for(self, search_filter):
+        # Shards are partitioned by source, so a filename filter only needs the shards holding those files
+        sources = filter_sources(search_filter)
+        if sources is None:
+            return self.shards
+        wanted = {shard_for({"source": source}, len(self.shards)) for source in sources}
+        return [shard for i, shard in enumerate(self.shards) if i in wanted]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k: int = 4, **kwargs):
+        futures = [
+            _fanout_pool.submit(shard.similarity_search_by_vector_with_relevance_scores, embedding, k, **kwargs)
+            for shard in self._shards_for(kwargs.get("filter"))
+        ]
+        candidates = [hit for future in futures for hit in future.result()]
+        # Chroma scores are distances: smaller is closer
+        return heapq.nsmallest(k, candidates, key=lambda hit: hit[1])
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs):
+        hits = self.similarity_search_by_vector_with_relevance_scores(embedding, k=k, **kwargs)
+        return [doc for doc, _ in hits]
+
+    # VectorStore requires these, but this is a read view: writes must go through the
+    # pipeline, which creates a new index version, routes chunks with shard_for and
+    # updates the metadata index. Writing here would modify a published, immutable version.
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise TypeError("ShardedVectorStore is read-only; add documents with rag.pipeline.index_chunks.")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise TypeError("ShardedVectorStore is read-only; build sharded indexes with rag.pipeline.index_chunks.")
@@ -17,8 +17,11 @@ def save_uploaded_file(uploaded_file, session_id):
     """
     Save uploaded file to the appropriate directory for the session
     """
-    # Get original filename
-    filename = getattr(uploaded_file, 'name', f"temp_file_{uuid.uuid4()}.bin")
+    # Get original filename: Flask's FileStorage has `filename` (its `name` is the form field),
+    # Streamlit's UploadedFile has `name`
+    filename = (getattr(uploaded_file, 'filename', None)
+                or getattr(uploaded_file, 'name', None)
+                or f"temp_file_{uuid.uuid4()}.bin")
     
     # Sanitize filename to prevent path traversal attacks
     filename = secure_filename(filename)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Rebuild every session's Chroma index, e.g. after switching embedding models.
+
+    python reindex.py --model sentence-transformers/all-mpnet-base-v2
+    python reindex.py --source uploads --sessions <id> <id> --workers 8
+    python reindex.py --list
+
+New indexes are built under storage/reindex/ and published as a new
+version of storage/chroma/<session_id> only when complete. Progress is checkpointed per batch in
+storage/reindex/checkpoint.json; rerunning the same command resumes.
+"""
+import argparse
+import json
+from pathlib import Path
+
+from rag.config import EMBEDDING_MODEL
+from rag.reindex import REINDEX_DIR, discover_sessions, reindex_sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed and rebuild all session indexes")
+    parser.add_argument("--model", default=EMBEDDING_MODEL, help="Embedding model to re-embed with")
+    parser.add_argument("--source", choices=["index", "uploads"], default="index",
+                        help="Read chunks from the current index or re-chunk the uploaded files")
+    parser.add_argument("--sessions", nargs="*", help="Only these session ids (default: all)")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, help="Embedding processes (default: min(4, CPUs))")
+    parser.add_argument("--space", choices=["l2", "cosine", "ip"], help="Distance function for the new indexes")
+    parser.add_argument("--chunk-size", type=int, default=800)
+    parser.add_argument("--chunk-overlap", type=int, default=150)
+    parser.add_argument("--restart", action="store_true", help="Discard the checkpoint and start over")
+    parser.add_argument("--list", action="store_true", help="List sessions that would be reindexed and exit")
+    args = parser.parse_args()
+
+    sessions = args.sessions or discover_sessions()
+    if args.list:
+        print("\n".join(sessions))
+        return
+
+    report = reindex_sessions(
+        sessions,
+        model_name=args.model,
+        source=args.source,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        space=args.space,
+        restart=args.restart,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+    )
+    report_path = Path(REINDEX_DIR) / "report.json"
+    report_path.write_text(json.dumps(report, indent=2))
+    print(f"Reindexed {report['total_chunks']} chunks in {report['total_seconds']}s "
+          f"({report['chunks_per_sec']} chunks/s). Report written to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
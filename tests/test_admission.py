@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+from rag.admission import ConcurrencyLimiter, Overloaded, RateLimited, RateLimiter
+
+
+def test_limiter_rejects_when_queue_is_full():
+    limiter = ConcurrencyLimiter("LLM", max_concurrent=1, max_queue=0, timeout=1)
+    with limiter.slot():
+        with pytest.raises(Overloaded) as excinfo:
+            with limiter.slot():
+                pass
+    assert excinfo.value.retry_after == 1
+    assert limiter.stats()["rejected_total"] == 1
+    with limiter.slot():  # the slot was released
+        pass
+
+
+def test_limiter_times_out_queued_request():
+    limiter = ConcurrencyLimiter("LLM", max_concurrent=1, max_queue=1, timeout=0.05)
+    with limiter.slot():
+        with pytest.raises(Overloaded, match="Timed out"):
+            with limiter.slot():
+                pass
+    stats = limiter.stats()
+    assert stats["queued"] == 0 and stats["active"] == 0
+
+
+def test_limiter_admits_queued_request_when_slot_frees():
+    limiter = ConcurrencyLimiter("LLM", max_concurrent=1, max_queue=1, timeout=5)
+    holding, admitted = threading.Event(), threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with limiter.slot():
+            holding.set()
+            release.wait()
+
+    def wait_for_slot():
+        with limiter.slot():
+            admitted.set()
+
+    threading.Thread(target=hold).start()
+    holding.wait()
+    waiter = threading.Thread(target=wait_for_slot)
+    waiter.start()
+    assert not admitted.wait(0.05)
+    release.set()
+    waiter.join(5)
+    assert admitted.is_set()
+    assert limiter.stats()["admitted_total"] == 2
+
+
+def test_rate_limiter_allows_burst_then_limits_per_key():
+    limiter = RateLimiter(rate=0.5, burst=2)
+    limiter.check("a")
+    limiter.check("a")
+    with pytest.raises(RateLimited) as excinfo:
+        limiter.check("a")
+    assert excinfo.value.retry_after == 2
+    limiter.check("b")  # other sessions have their own bucket
+    assert limiter.stats()["limited_total"] == 1
+
+
+def test_rate_limiter_disabled_with_zero_rate():
+    limiter = RateLimiter(rate=0, burst=1)
+    for _ in range(10):
+        limiter.check("a")
@@ -0,0 +1,97 @@
+import json
+import os
+import time
+
+from rag.index_store import (CURRENT_NAME, RETIRED_NAME, VERSIONS_DIR, collect_garbage, current_index_dir,
+                             new_version_dir, publish_version, writer_lock)
+from rag.sharding import MANIFEST_NAME, shard_for
+
+
+def make_version(session_dir, files=("chroma.sqlite3",)):
+    with writer_lock(session_dir):
+        version = new_version_dir(session_dir, copy_current=False)
+        for name in files:
+            path = version / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(name)
+        return version
+
+
+def retire(version, seconds_ago):
+    (version / RETIRED_NAME).write_text(str(time.time() - seconds_ago))
+
+
+def test_publish_swaps_pointer_and_retires_previous(tmp_path):
+    session = tmp_path / "session"
+    first = make_version(session)
+    publish_version(session, first)
+    assert current_index_dir(session) == first
+
+    second = make_version(session)
+    publish_version(session, second)
+    assert (session / CURRENT_NAME).read_text() == second.name
+    assert current_index_dir(session) == second
+    assert (first / RETIRED_NAME).exists()  # kept for in-flight readers
+    assert not (second / RETIRED_NAME).exists()
+
+
+def test_collect_garbage_respects_grace_period(tmp_path):
+    session = tmp_path / "session"
+    live = make_version(session)
+    publish_version(session, live)
+    recent, old = make_version(session), make_version(session)
+    retire(recent, seconds_ago=10)
+    retire(old, seconds_ago=1000)
+
+    collect_garbage(session, grace_seconds=300)
+    assert live.exists() and recent.exists()
+    assert not old.exists()
+
+
+def test_collect_garbage_removes_stale_unpublished_builds_only(tmp_path):
+    session = tmp_path / "session"
+    live = make_version(session)
+    publish_version(session, live)
+    crashed, building = make_version(session), make_version(session)
+    stale = time.time() - 1000
+    os.utime(crashed, (stale, stale))
+
+    collect_garbage(session, grace_seconds=300)
+    assert not crashed.exists()
+    assert building.exists() and live.exists()
+
+
+def test_legacy_index_is_seeded_then_collected(tmp_path):
+    session = tmp_path / "session"
+    session.mkdir()
+    (session / "chroma.sqlite3").write_text("legacy")
+    assert current_index_dir(session) == session
+
+    with writer_lock(session):
+        version = new_version_dir(session)
+    assert (version / "chroma.sqlite3").read_text() == "legacy"
+    publish_version(session, version)
+    assert (session / "chroma.sqlite3").exists()  # still readable during the grace period
+
+    collect_garbage(session, grace_seconds=-1)
+    assert not (session / "chroma.sqlite3").exists()
+    assert current_index_dir(session) == version
+
+
+def test_sharded_version_copies_only_touched_shards(tmp_path):
+    session = tmp_path / "session"
+    num_shards = 4
+    source = "uploads/new.pdf"
+    touched = shard_for({"source": source}, num_shards)
+    live = make_version(session, [f"shards/{i}/chroma.sqlite3" for i in range(num_shards)])
+    (live / MANIFEST_NAME).write_text(json.dumps({"num_shards": num_shards}))
+    publish_version(session, live)
+
+    with writer_lock(session):
+        version = new_version_dir(session, sources=[source])
+    assert json.loads((version / MANIFEST_NAME).read_text()) == {"num_shards": num_shards}
+    for i in range(num_shards):
+        links = (version / "shards" / str(i) / "chroma.sqlite3").stat().st_nlink
+        assert links == (1 if i == touched else 2)
+    assert not (version / RETIRED_NAME).exists()
+    assert version.parent.name == VERSIONS_DIR
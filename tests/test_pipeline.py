@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+from langchain.schema import Document
+
+import rag.pipeline
+from rag.index_store import VERSIONS_DIR, current_index_dir
+from rag.pipeline import index_chunks, ingest_files
+from rag.scoping import load_metadata_index
+
+
+class FakeEmbeddings:
+    def __init__(self, fail_after=None):
+        self.calls = 0
+        self.fail_after = fail_after
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise RuntimeError("embedding backend down")
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def chunks(source, count):
+    return [Document(page_content=f"{source} chunk {i}", metadata={"source": source, "page": i}) for i in range(count)]
+
+
+def fake_loader(path):
+    if "corrupt" in path:
+        raise ValueError("Only PDF and DOCX are supported.")
+    return chunks(path, 3)
+
+
+def ingest_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith("ingest-")]
+
+
+def assert_nothing_published(session):
+    assert current_index_dir(session) is None
+    assert not any((session / VERSIONS_DIR).iterdir())
+    assert not ingest_threads()
+
+
+def test_index_chunks_publishes_version_with_metadata_index(tmp_path):
+    session = tmp_path / "session"
+    written = index_chunks(chunks("a.pdf", 5) + chunks("b.pdf", 2), str(session), FakeEmbeddings(), batch_size=2)
+    assert written == 7
+    live = current_index_dir(session)
+    files = load_metadata_index(str(live))["files"]
+    assert {source: entry["chunks"] for source, entry in files.items()} == {"a.pdf": 5, "b.pdf": 2}
+    assert not ingest_threads()
+
+
+def test_embedding_error_propagates_and_publishes_nothing(tmp_path):
+    session = tmp_path / "session"
+    with pytest.raises(RuntimeError, match="embedding backend down"):
+        index_chunks(chunks("a.pdf", 20), str(session), FakeEmbeddings(fail_after=2), batch_size=2, queue_depth=1)
+    assert_nothing_published(session)
+
+
+def test_loader_error_propagates_and_keeps_live_version(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag.pipeline, "load_documents", fake_loader)
+    session = tmp_path / "session"
+    stats = ingest_files(["good.pdf"], str(session), FakeEmbeddings(), chunk_size=50)
+    assert stats == {"files": 1, "pages": 3, "chunks": 3}
+    live = current_index_dir(session)
+
+    with pytest.raises(ValueError, match="Only PDF and DOCX"):
+        ingest_files(["other.pdf", "corrupt.pdf"], str(session), FakeEmbeddings(), chunk_size=50)
+    assert current_index_dir(session) == live
+    assert [p.name for p in (session / VERSIONS_DIR).iterdir()] == [live.name]
+    assert not ingest_threads()
+
+
+def test_empty_input_publishes_nothing(tmp_path):
+    session = tmp_path / "session"
+    assert index_chunks([], str(session), FakeEmbeddings()) == 0
+    assert_nothing_published(session)
@@ -0,0 +1,68 @@
+import pytest
+
+import rag.reindex
+from rag.index_store import current_index_dir, new_version_dir, publish_version, writer_lock
+from rag.reindex import Checkpoint, SourceChanged, swap_index
+
+
+@pytest.fixture
+def chroma_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag.reindex, "CHROMA_DIR", str(tmp_path / "chroma"))
+    return tmp_path / "chroma"
+
+
+def publish_new_version(session):
+    with writer_lock(session):
+        version = new_version_dir(session, copy_current=False)
+        (version / "chroma.sqlite3").write_text("index")
+        publish_version(session, version)
+    return version
+
+
+def staged_build(tmp_path, checkpoint, source_version):
+    staging = tmp_path / "reindex" / "s1"
+    staging.mkdir(parents=True)
+    (staging / "chroma.sqlite3").write_text("rebuilt")
+    progress = checkpoint.session("s1")
+    progress.update(status="built", source_version=source_version, chunks=1)
+    return staging, progress
+
+
+def test_checkpoint_resumes_and_guards_settings(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    checkpoint = Checkpoint(path, {"model": "a"})
+    checkpoint.session("s1")["batches_done"] = 3
+    checkpoint.save()
+
+    assert Checkpoint(path, {"model": "a"}).session("s1")["batches_done"] == 3
+    with pytest.raises(ValueError, match="different settings"):
+        Checkpoint(path, {"model": "b"})
+    assert Checkpoint(path, {"model": "b"}, restart=True).session("s1")["batches_done"] == 0
+
+
+def test_swap_publishes_when_source_is_still_live(tmp_path, chroma_dir):
+    session = chroma_dir / "s1"
+    source = publish_new_version(session)
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json", {})
+    staging, progress = staged_build(tmp_path, checkpoint, source.name)
+
+    swap_index("s1", staging, progress, checkpoint)
+    live = current_index_dir(session)
+    assert live.name == progress["version"]
+    assert (live / "chroma.sqlite3").read_text() == "rebuilt"
+
+    swap_index("s1", staging, progress, checkpoint)  # rerun after a crash before "swapped" was saved
+    assert current_index_dir(session) == live
+
+
+def test_swap_refuses_to_overwrite_newer_version(tmp_path, chroma_dir):
+    session = chroma_dir / "s1"
+    source = publish_new_version(session)
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json", {})
+    staging, progress = staged_build(tmp_path, checkpoint, source.name)
+    upload = publish_new_version(session)  # an upload lands during the rebuild
+
+    with pytest.raises(SourceChanged):
+        swap_index("s1", staging, progress, checkpoint)
+    assert current_index_dir(session) == upload
+    assert staging.exists()
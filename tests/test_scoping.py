@@ -0,0 +1,57 @@
+import pytest
+
+from rag.scoping import build_search_filter, filter_sources, load_metadata_index, update_metadata_index
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    update_metadata_index(str(tmp_path), [
+        {"source": "storage/uploads/s1/Guideline.pdf", "page": 0},
+        {"source": "storage/uploads/s1/Guideline.pdf", "page": 4},
+        {"source": "storage/uploads/s1/notes.docx"},
+    ])
+    return tmp_path
+
+
+def test_metadata_index_tracks_pages_and_chunks(index_dir):
+    files = load_metadata_index(str(index_dir))["files"]
+    assert files["storage/uploads/s1/Guideline.pdf"] == {
+        "filename": "Guideline.pdf", "first_page": 0, "last_page": 4, "chunks": 2,
+    }
+    assert files["storage/uploads/s1/notes.docx"]["first_page"] is None
+
+
+def test_only_if_missing_never_replaces_existing_index(index_dir):
+    update_metadata_index(str(index_dir), [{"source": "other.pdf"}], only_if_missing=True)
+    assert "other.pdf" not in load_metadata_index(str(index_dir))["files"]
+
+
+def test_empty_scope_has_no_filter(index_dir):
+    assert build_search_filter(str(index_dir)) is None
+
+
+def test_filename_is_case_insensitive_and_pages_are_one_based(index_dir):
+    search_filter = build_search_filter(str(index_dir), "guideline.pdf", page_from=2, page_to=5)
+    assert search_filter == {"$and": [
+        {"source": {"$in": ["storage/uploads/s1/Guideline.pdf"]}},
+        {"page": {"$gte": 1}},
+        {"page": {"$lte": 4}},
+    ]}
+    assert filter_sources(search_filter) == ["storage/uploads/s1/Guideline.pdf"]
+
+
+def test_page_range_alone_allows_any_source(index_dir):
+    search_filter = build_search_filter(str(index_dir), page_from=3)
+    assert search_filter == {"page": {"$gte": 2}}
+    assert filter_sources(search_filter) is None
+
+
+@pytest.mark.parametrize("kwargs, message", [
+    ({"filename": "missing.pdf"}, "No uploaded document named missing.pdf"),
+    ({"page_from": 0}, "page_from must be 1 or greater"),
+    ({"page_to": 0}, "page_to must be 1 or greater"),
+    ({"page_from": 5, "page_to": 2}, "page_to must not be before page_from"),
+])
+def test_invalid_scopes_are_rejected(index_dir, kwargs, message):
+    with pytest.raises(ValueError, match=message):
+        build_search_filter(str(index_dir), **kwargs)